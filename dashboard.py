@@ -1,7 +1,14 @@
+import os
+import tempfile
+from pathlib import Path
+
 import streamlit as st
+import numpy as np
 import pandas as pd
-import plotly.express as px
+from plotly.colors import qualitative
 import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.feather as feather
 
 # --------------------------------------------------
 # PAGE CONFIG
@@ -40,14 +47,171 @@ st.divider()
 # --------------------------------------------------
 # LOAD DATA
 # --------------------------------------------------
-@st.cache_data
+# Every output column is loaded (the review tables show all of them, including
+# the source fields behind each flag), each downcast to the narrowest dtype
+# that holds it (int8 scores, bool flags, categorical labels). Currency stays
+# float64 so cent-level JE amounts are exact.
+AP_COLS = {
+    "Invoice_ID": "string",
+    "Vendor": "category",
+    "Invoice_Date": "string",
+    "Due_Date": "string",
+    "Project_ID": "category",
+    "GL_Account": "category",
+    "Amount_Before_Tax": "float64",
+    "Tax_Jurisdiction": "category",
+    "Tax_Amount": "float64",
+    "Total_Invoice_Amount": "float64",
+    "Paid_Flag": "bool",
+    "Paid_Date": "string",
+    "Expected_Total": "float64",
+    "Total_Mismatch_Flag": "bool",
+    "Unpaid_AsOfYE": "bool",
+    "AP_Match_Key": "string",
+    "Bank_Match_Status": "category",
+    "amount_mismatch": "bool",
+    "missing_in_GL": "bool",
+    "late_posting": "bool",
+    "duplicate_invoice_number": "bool",
+    "mode_gl": "category",
+    "unusual_GL_account": "bool",
+    "risk_score": "int8",
+    "risk_level": "category",
+}
+BANK_COLS = {
+    "Bank_Txn_ID": "string",
+    "Date": "string",
+    "Vendor": "category",
+    "Description": "string",
+    "Amount": "float64",
+    "Check_ACH": "category",
+    "Cleared_Flag": "bool",
+    "Match_Key": "string",
+    "Duplicate_Payment": "int16",
+    "Duplicate_Payment_Flag": "category",
+    "Invoice_Amount": "float64",
+    "no_matching_invoice": "bool",
+    "duplicate_payment": "bool",
+    "amount_mismatch": "bool",
+    "q90": "float64",
+    "unusual_vendor_payment": "bool",
+    "invoice_marked_paid_but_no_bank_txn": "bool",
+    "risk_score": "int8",
+    "risk_level": "category",
+}
+TAX_COLS = {
+    "Invoice_ID": "string",
+    "State": "category",
+    "Taxable_Amount": "float64",
+    "Tax_Rate": "float64",
+    "Calculated_Tax": "float64",
+    "GL_Tax_Liability_Account": "category",
+    "Recalc_Tax": "float64",
+    "Tax_Mismatch_Flag": "category",
+    "Correct_Tax_Rate": "float64",
+    "Correct_Rate_Flag": "bool",
+    "Ref_Tax_Rate": "float64",
+    "jurisdiction_missing": "bool",
+    "rate_mismatch": "bool",
+    "tax_missing": "bool",
+    "tax_on_nontaxable_item": "bool",
+    "tax_diff_abs": "float64",
+    "gl_tax_diff_flag": "bool",
+    "risk_score": "int8",
+    "risk_level": "category",
+}
+LEASE_COLS = {
+    "Lease_ID": "string",
+    "Start_Date": "string",
+    "Payment_Date": "string",
+    "Lease_Payment": "float64",
+    "Interest_Portion": "float64",
+    "Principal_Portion": "float64",
+    "Ending_Lease_Liability": "float64",
+    "ROU_Asset_Balance": "float64",
+    "IP_Sum": "float64",
+    "IP_Sum_Diff": "float64",
+    "IP_Sum_Mismatch_Flag": "bool",
+    "Sequence_Check": "category",
+    "ip_sum_mismatch": "bool",
+    "missing_periods": "bool",
+    "schedule_to_GL_liability_diff_flag": "bool",
+    "schedule_to_GL_ROU_diff_flag": "bool",
+    "incorrect_opening_entry": "bool",
+    "classification_flag": "bool",
+    "risk_score": "int8",
+    "risk_level": "category",
+}
+
+CACHE_DIR = Path("output/_cache")
+
+# Granularity of the "Minimum Risk Score" slider
+RISK_STEP = 5
+
+
+def read_output(name: str, columns: dict[str, str]) -> pd.DataFrame:
+    # Prefer the Parquet copy written by validator.py; fall back to the CSV
+    parquet_path = Path(f"output/{name}.parquet")
+    source_path = parquet_path if parquet_path.exists() else Path(f"output/{name}.csv")
+
+    # On-disk Arrow cache: memory-mapped on cold start so it survives app reboots
+    # and its pages are shared across workers through the OS page cache.
+    cache_path = CACHE_DIR / f"{name}.arrow"
+    if cache_path.exists() and cache_path.stat().st_mtime >= source_path.stat().st_mtime:
+        try:
+            table = feather.read_table(cache_path, memory_map=True)
+        except (pa.ArrowInvalid, OSError):
+            table = None  # unreadable cache — rebuild it from the source below
+        if table is not None and set(columns) <= set(table.column_names):
+            return table.select(list(columns)).to_pandas().astype(columns)
+
+    if source_path == parquet_path:
+        df = pd.read_parquet(parquet_path, columns=list(columns))
+    else:
+        df = pd.read_csv(source_path, usecols=list(columns))[list(columns)]
+    df = df.astype(columns)
+
+    # Write to a temp file and swap it in, so a crash or a concurrent worker
+    # never leaves a half-written cache behind at the final path
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".arrow.tmp")
+        os.close(fd)
+        try:
+            feather.write_feather(df, tmp_path, compression="uncompressed")
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    except OSError:
+        pass  # read-only deploys just skip the disk cache
+    return df
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
 def load_data():
-    ap = pd.read_csv("output/AP_with_risk.csv")
-    bank = pd.read_csv("output/Bank_with_risk.csv")
-    tax = pd.read_csv("output/Tax_with_risk.csv")
-    lease = pd.read_csv("output/Lease_with_risk.csv")
+    ap = read_output("AP_with_risk", AP_COLS)
+    bank = read_output("Bank_with_risk", BANK_COLS)
+    tax = read_output("Tax_with_risk", TAX_COLS)
+    lease = read_output("Lease_with_risk", LEASE_COLS)
+
+    # The threshold is always a multiple of RISK_STEP, so risk_score >= t is
+    # exactly risk_bucket >= t // RISK_STEP — compared on a compact int8 column
+    for df in (ap, bank, tax, lease):
+        df["risk_bucket"] = (df["risk_score"].to_numpy() // RISK_STEP).astype(np.int8)
     return ap, bank, tax, lease
 
+
+@st.cache_data(show_spinner=False)
+def vendor_options(ap):
+    return sorted(ap["Vendor"].dropna().unique().tolist())
+
+
+@st.cache_data(show_spinner=False)
+def filter_by_vendor(df, vendors):
+    # vendors is a tuple so the selection is hashable as a cache key
+    return df[df["Vendor"].isin(vendors)]
+
 ap_df, bank_df, tax_df, lease_df = load_data()
 
 # --------------------------------------------------
@@ -60,18 +224,79 @@ risk_threshold = st.sidebar.slider(
     min_value=0,
     max_value=100,
     value=60,
-    step=5,
+    step=RISK_STEP,
     help="Focus the dashboard on higher-risk items."
 )
 
 vendor_filter = st.sidebar.multiselect(
     "Vendor",
-    sorted(ap_df["Vendor"].dropna().unique())
+    vendor_options(ap_df)
 )
 
+table_page_size = st.sidebar.number_input(
+    "Rows per Table",
+    min_value=50,
+    max_value=5000,
+    value=500,
+    step=50,
+    help="Detail tables are paginated so large exception lists stay responsive."
+)
+
+# --------------------------------------------------
+# HIGH-RISK VIEWS (computed once per filter combination)
+# --------------------------------------------------
+@st.cache_data(show_spinner=False)
+def compute_views(ap, bank, tax, lease, threshold):
+    views = {}
+    for name, df in [("ap", ap), ("bank", bank), ("tax", tax), ("lease", lease)]:
+        # Source order feeds the JE builder; the sorted copy is for the review tables
+        high_risk = df[df["risk_bucket"].to_numpy() >= threshold // RISK_STEP]
+        views[f"{name}_hi"] = high_risk
+        views[f"{name}_hi_sorted"] = high_risk.sort_values("risk_score", ascending=False, kind="stable")
+    views["counts"] = tuple(len(views[f"{name}_hi"]) for name in ["ap", "bank", "tax", "lease"])
+    return views
+
 if vendor_filter:
-    ap_df = ap_df[ap_df["Vendor"].isin(vendor_filter)]
-    bank_df = bank_df[bank_df["Vendor"].isin(vendor_filter)]
+    ap_df = filter_by_vendor(ap_df, tuple(vendor_filter))
+    bank_df = filter_by_vendor(bank_df, tuple(vendor_filter))
+
+views = compute_views(ap_df, bank_df, tax_df, lease_df, risk_threshold)
+ap_hi_count, bank_hi_count, tax_hi_count, lease_hi_count = views["counts"]
+
+# --------------------------------------------------
+# CHART RENDERING
+# --------------------------------------------------
+def show_chart(fig, key: str):
+    # A stable key keeps the chart element mounted across reruns, and a fixed
+    # uirevision lets Plotly.react diff the new figure into the existing div
+    # (preserving zoom/legend state) instead of rebuilding it from scratch.
+    fig.update_layout(uirevision=key)
+    st.plotly_chart(fig, key=key, use_container_width=True)
+
+
+def histogram_fig(values, nbins: int, title: str):
+    # Bin server-side so only the bin counts are shipped to the browser
+    counts, edges = np.histogram(values, bins=nbins)
+    fig = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=edges[1] - edges[0]))
+    fig.update_layout(title=title, xaxis_title="risk_score", yaxis_title="count", bargap=0)
+    return fig
+
+
+def show_table(df, key: str):
+    # Only one page of rows is sent to the browser at a time
+    n_pages = max(1, -(-len(df) // table_page_size))
+    page = 1
+    if n_pages > 1:
+        page = st.number_input(
+            f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, key=f"{key}_page"
+        )
+    start = (page - 1) * table_page_size
+    st.dataframe(
+        df.iloc[start:start + table_page_size].drop(columns="risk_bucket", errors="ignore"),
+        use_container_width=True
+    )
+    if n_pages > 1:
+        st.caption(f"Showing rows {start + 1:,}–{min(start + table_page_size, len(df)):,} of {len(df):,}")
 
 # --------------------------------------------------
 # EXECUTIVE SCORECARD
@@ -81,10 +306,10 @@ st.subheader("Executive Close Status")
 k1, k2, k3, k4, k5 = st.columns(5)
 
 k1.metric("AP Invoices", f"{len(ap_df):,}")
-k2.metric("High-Risk AP", f"{(ap_df['risk_score'] >= risk_threshold).sum():,}")
-k3.metric("High-Risk Bank Items", f"{(bank_df['risk_score'] >= risk_threshold).sum():,}")
-k4.metric("Tax Exceptions", f"{(tax_df['risk_score'] >= risk_threshold).sum():,}")
-k5.metric("Lease Exceptions", f"{(lease_df['risk_score'] >= risk_threshold).sum():,}")
+k2.metric("High-Risk AP", f"{ap_hi_count:,}")
+k3.metric("High-Risk Bank Items", f"{bank_hi_count:,}")
+k4.metric("Tax Exceptions", f"{tax_hi_count:,}")
+k5.metric("Lease Exceptions", f"{lease_hi_count:,}")
 
 st.divider()
 
@@ -98,23 +323,17 @@ st.header(
 
 health_df = pd.DataFrame({
     "Area": ["AP", "Bank", "Tax", "Leases"],
-    "High Risk Items": [
-        (ap_df["risk_score"] >= risk_threshold).sum(),
-        (bank_df["risk_score"] >= risk_threshold).sum(),
-        (tax_df["risk_score"] >= risk_threshold).sum(),
-        (lease_df["risk_score"] >= risk_threshold).sum()
-    ]
+    "High Risk Items": [ap_hi_count, bank_hi_count, tax_hi_count, lease_hi_count]
 })
 
-health_fig = px.bar(
-    health_df,
-    x="Area",
-    y="High Risk Items",
-    title="High-Risk Items by Close Area",
-    color="Area"
-)
+health_fig = go.Figure(go.Bar(
+    x=health_df["Area"],
+    y=health_df["High Risk Items"],
+    marker_color=qualitative.Plotly[:len(health_df)],
+))
+health_fig.update_layout(title="High-Risk Items by Close Area", xaxis_title="Area", yaxis_title="High Risk Items")
 
-st.plotly_chart(health_fig, use_container_width=True)
+show_chart(health_fig, "health_fig")
 
 st.caption(
     "This view is designed for senior leadership to quickly see where residual risk is concentrated at year-end."
@@ -131,13 +350,8 @@ st.header(
 )
 
 
-ap_risk_dist = px.histogram(
-    ap_df,
-    x="risk_score",
-    nbins=25,
-    title="AP Risk Score Distribution",
-)
-st.plotly_chart(ap_risk_dist, use_container_width=True)
+ap_risk_dist = histogram_fig(ap_df["risk_score"], 25, "AP Risk Score Distribution")
+show_chart(ap_risk_dist, "ap_risk_dist")
 
 ap_root_cause = pd.DataFrame({
     "Issue": ["Missing in GL", "Amount Mismatch", "Duplicate Invoice", "Unusual GL"],
@@ -149,21 +363,13 @@ ap_root_cause = pd.DataFrame({
     ]
 })
 
-ap_cause_fig = px.pie(
-    ap_root_cause,
-    names="Issue",
-    values="Count",
-    title="AP Exception Root Causes"
-)
+ap_cause_fig = go.Figure(go.Pie(labels=ap_root_cause["Issue"], values=ap_root_cause["Count"]))
+ap_cause_fig.update_layout(title="AP Exception Root Causes")
 
-st.plotly_chart(ap_cause_fig, use_container_width=True)
+show_chart(ap_cause_fig, "ap_cause_fig")
 
 st.subheader("High-Risk AP Invoices")
-st.dataframe(
-    ap_df[ap_df["risk_score"] >= risk_threshold]
-    .sort_values("risk_score", ascending=False),
-    use_container_width=True
-)
+show_table(views["ap_hi_sorted"], "ap_hi")
 
 st.divider()
 
@@ -175,13 +381,10 @@ st.header(
     help="Highlights vendors and payments with higher cash control risk, including duplicate payments and payments without matching invoices."
 )
 
-bank_vendor_fig = px.bar(
-    bank_df.groupby("Vendor")["risk_score"].mean().reset_index(),
-    x="Vendor",
-    y="risk_score",
-    title="Average Bank Risk by Vendor"
-)
-st.plotly_chart(bank_vendor_fig, use_container_width=True)
+bank_vendor_risk = bank_df.groupby("Vendor", observed=True)["risk_score"].mean()
+bank_vendor_fig = go.Figure(go.Bar(x=bank_vendor_risk.index.astype(str), y=bank_vendor_risk.to_numpy()))
+bank_vendor_fig.update_layout(title="Average Bank Risk by Vendor", xaxis_title="Vendor", yaxis_title="risk_score")
+show_chart(bank_vendor_fig, "bank_vendor_fig")
 
 bank_flags = pd.DataFrame({
     "Issue": ["No Matching Invoice", "Duplicate Payment", "Amount Mismatch"],
@@ -192,21 +395,13 @@ bank_flags = pd.DataFrame({
     ]
 })
 
-bank_flag_fig = px.bar(
-    bank_flags,
-    x="Issue",
-    y="Count",
-    title="Bank Exception Breakdown"
-)
+bank_flag_fig = go.Figure(go.Bar(x=bank_flags["Issue"], y=bank_flags["Count"]))
+bank_flag_fig.update_layout(title="Bank Exception Breakdown", xaxis_title="Issue", yaxis_title="Count")
 
-st.plotly_chart(bank_flag_fig, use_container_width=True)
+show_chart(bank_flag_fig, "bank_flag_fig")
 
 st.subheader("Payments Requiring Review")
-st.dataframe(
-    bank_df[bank_df["risk_score"] >= risk_threshold]
-    .sort_values("risk_score", ascending=False),
-    use_container_width=True
-)
+show_table(views["bank_hi_sorted"], "bank_hi")
 
 st.divider()
 
@@ -218,13 +413,10 @@ st.header(
     help="Summarizes tax risk by jurisdiction and exception type so the team can validate Florida sales and use tax before filing."
 )
 
-tax_juris_fig = px.bar(
-    tax_df.groupby("State")["risk_score"].mean().reset_index(),
-    x="State",
-    y="risk_score",
-    title="Average Tax Risk by Jurisdiction"
-)
-st.plotly_chart(tax_juris_fig, use_container_width=True)
+tax_juris_risk = tax_df.groupby("State", observed=True)["risk_score"].mean()
+tax_juris_fig = go.Figure(go.Bar(x=tax_juris_risk.index.astype(str), y=tax_juris_risk.to_numpy()))
+tax_juris_fig.update_layout(title="Average Tax Risk by Jurisdiction", xaxis_title="State", yaxis_title="risk_score")
+show_chart(tax_juris_fig, "tax_juris_fig")
 
 tax_issue_mix = pd.DataFrame({
     "Issue": ["Rate Mismatch", "Missing Tax", "GL Variance"],
@@ -235,20 +427,12 @@ tax_issue_mix = pd.DataFrame({
     ]
 })
 
-tax_issue_fig = px.pie(
-    tax_issue_mix,
-    names="Issue",
-    values="Count",
-    title="Tax Compliance Issues"
-)
-st.plotly_chart(tax_issue_fig, use_container_width=True)
+tax_issue_fig = go.Figure(go.Pie(labels=tax_issue_mix["Issue"], values=tax_issue_mix["Count"]))
+tax_issue_fig.update_layout(title="Tax Compliance Issues")
+show_chart(tax_issue_fig, "tax_issue_fig")
 
 st.subheader("Tax Items Needing Adjustment")
-st.dataframe(
-    tax_df[tax_df["risk_score"] >= risk_threshold]
-    .sort_values("risk_score", ascending=False),
-    use_container_width=True
-)
+show_table(views["tax_hi_sorted"], "tax_hi")
 
 st.divider()
 
@@ -260,13 +444,8 @@ st.header(
     help="Shows lease-related exceptions such as missing periods and schedule versus general ledger variances for ASC 842 compliance."
 )
 
-lease_risk_fig = px.histogram(
-    lease_df,
-    x="risk_score",
-    nbins=20,
-    title="Lease Risk Distribution"
-)
-st.plotly_chart(lease_risk_fig, use_container_width=True)
+lease_risk_fig = histogram_fig(lease_df["risk_score"], 20, "Lease Risk Distribution")
+show_chart(lease_risk_fig, "lease_risk_fig")
 
 lease_issues = pd.DataFrame({
     "Issue": ["Missing Periods", "IP Sum Mismatch", "GL Tie-Out Variance"],
@@ -277,20 +456,12 @@ lease_issues = pd.DataFrame({
     ]
 })
 
-lease_issue_fig = px.bar(
-    lease_issues,
-    x="Issue",
-    y="Count",
-    title="Lease Exception Breakdown"
-)
-st.plotly_chart(lease_issue_fig, use_container_width=True)
+lease_issue_fig = go.Figure(go.Bar(x=lease_issues["Issue"], y=lease_issues["Count"]))
+lease_issue_fig.update_layout(title="Lease Exception Breakdown", xaxis_title="Issue", yaxis_title="Count")
+show_chart(lease_issue_fig, "lease_issue_fig")
 
 st.subheader("Lease Records Requiring Review")
-st.dataframe(
-    lease_df[lease_df["risk_score"] >= risk_threshold]
-    .sort_values("risk_score", ascending=False),
-    use_container_width=True
-)
+show_table(views["lease_hi_sorted"], "lease_hi")
 
 st.divider()
 
@@ -308,68 +479,80 @@ st.markdown(
 )
 
 # ---------- Build JE Table ----------
-je_rows = []
-
-# AP JEs
-high_risk_ap = ap_df[ap_df["risk_score"] >= risk_threshold]
-for _, row in high_risk_ap.iterrows():
-    if row.get("missing_in_GL"):
-        je_rows.append({
-            "Source": "AP",
-            "Reference": row["Invoice_ID"],
-            "Debit_Account": "Project Expense",
-            "Credit_Account": "Accounts Payable",
-            "Amount": round(row["Expected_Total"], 2),
-            "Description": f"Record missing AP invoice {row['Invoice_ID']}"
-        })
-    elif row.get("amount_mismatch"):
-        diff = row["Expected_Total"] - row["Total_Invoice_Amount"]
-        if diff > 0:
-            je_rows.append({
-                "Source": "AP",
-                "Reference": row["Invoice_ID"],
-                "Debit_Account": "Project Expense",
-                "Credit_Account": "Accounts Payable",
-                "Amount": round(abs(diff), 2),
-                "Description": f"Correct AP under-accrual for invoice {row['Invoice_ID']}"
-            })
-        else:
-            je_rows.append({
-                "Source": "AP",
-                "Reference": row["Invoice_ID"],
-                "Debit_Account": "Accounts Payable",
-                "Credit_Account": "Project Expense",
-                "Amount": round(abs(diff), 2),
-                "Description": f"Correct AP over-accrual for invoice {row['Invoice_ID']}"
-            })
-
-# Tax JEs
-high_risk_tax = tax_df[tax_df["risk_score"] >= risk_threshold]
-for _, row in high_risk_tax.iterrows():
-    tax_diff = row["Recalc_Tax"] - row["Calculated_Tax"]
-    if abs(tax_diff) > 1:
-        je_rows.append({
-            "Source": "Tax",
-            "Reference": row["Invoice_ID"],
-            "Debit_Account": "Sales Tax Expense",
-            "Credit_Account": "Sales & Use Tax Payable",
-            "Amount": round(abs(tax_diff), 2),
-            "Description": f"True-up sales tax for invoice {row['Invoice_ID']}"
-        })
-
-# Lease JEs
-high_risk_leases = lease_df[lease_df["risk_score"] >= risk_threshold]
-for _, row in high_risk_leases.iterrows():
-    je_rows.append({
-        "Source": "Lease",
-        "Reference": row["Lease_ID"],
-        "Debit_Account": "Lease Liability",
-        "Credit_Account": "Prior Period Adjustment",
-        "Amount": round(abs(row["Ending_Lease_Liability"] * 0.01), 2),
-        "Description": f"Adjust lease liability for {row['Lease_ID']}"
+def je_block(reference, debit, credit, amount, description) -> dict:
+    # Column arrays for one JE source; scalar accounts/descriptions are broadcast.
+    # Amounts go through Python's round(), which is correctly rounded — ndarray.round
+    # scales by 100 first and can land a cent low (102.685 -> 102.68).
+    n = len(reference)
+    return {
+        "Reference": np.asarray(reference, dtype=object),
+        "Debit_Account": np.broadcast_to(np.asarray(debit, dtype=object), (n,)),
+        "Credit_Account": np.broadcast_to(np.asarray(credit, dtype=object), (n,)),
+        "Amount": np.array([round(x, 2) for x in np.asarray(amount, dtype="float64").tolist()], dtype="float64"),
+        "Description": np.broadcast_to(np.asarray(description, dtype=object), (n,)),
+    }
+
+
+@st.cache_data(show_spinner=False)
+def build_je(high_risk_ap, high_risk_tax, high_risk_leases):
+    # Returns the JE frame plus its encoded CSV so the export isn't re-serialized every rerun
+
+    # AP JEs — missing invoices first, otherwise amount mismatches
+    missing = high_risk_ap["missing_in_GL"].fillna(False).astype(bool)
+    mismatch = high_risk_ap["amount_mismatch"].fillna(False).astype(bool)
+    ap_je_src = high_risk_ap[missing | mismatch]
+    missing = missing[missing | mismatch].to_numpy()
+
+    ap_diff = ap_je_src["Expected_Total"] - ap_je_src["Total_Invoice_Amount"]
+    under_accrual = missing | (ap_diff > 0).to_numpy()
+    ap_je = je_block(
+        ap_je_src["Invoice_ID"],
+        np.where(under_accrual, "Project Expense", "Accounts Payable"),
+        np.where(under_accrual, "Accounts Payable", "Project Expense"),
+        np.where(missing, ap_je_src["Expected_Total"], ap_diff.abs()),
+        np.select(
+            [missing, under_accrual],
+            ["Record missing AP invoice ", "Correct AP under-accrual for invoice "],
+            "Correct AP over-accrual for invoice ",
+        ) + ap_je_src["Invoice_ID"].astype(str).to_numpy(),
+    )
+
+    # Tax JEs
+    tax_diff = (high_risk_tax["Recalc_Tax"] - high_risk_tax["Calculated_Tax"]).abs()
+    tax_je_src = high_risk_tax[tax_diff > 1]
+    tax_je = je_block(
+        tax_je_src["Invoice_ID"],
+        "Sales Tax Expense",
+        "Sales & Use Tax Payable",
+        tax_diff[tax_diff > 1],
+        "True-up sales tax for invoice " + tax_je_src["Invoice_ID"].astype(str),
+    )
+
+    # Lease JEs
+    lease_je = je_block(
+        high_risk_leases["Lease_ID"],
+        "Lease Liability",
+        "Prior Period Adjustment",
+        (high_risk_leases["Ending_Lease_Liability"] * 0.01).abs(),
+        "Adjust lease liability for " + high_risk_leases["Lease_ID"].astype(str),
+    )
+
+    # Stitch the sources column-by-column and build the frame once with explicit dtypes
+    blocks = {"AP": ap_je, "Tax": tax_je, "Lease": lease_je}
+    sizes = [len(block["Reference"]) for block in blocks.values()]
+    columns = {col: np.concatenate([block[col] for block in blocks.values()]) for col in ap_je}
+    je_df = pd.DataFrame({
+        "Source": pd.Categorical.from_codes(np.repeat(np.arange(len(blocks)), sizes), categories=list(blocks)),
+        "Reference": columns["Reference"],
+        "Debit_Account": pd.Categorical(columns["Debit_Account"]),
+        "Credit_Account": pd.Categorical(columns["Credit_Account"]),
+        "Amount": columns["Amount"],
+        "Description": columns["Description"],
     })
+    return je_df, je_df.to_csv(index=False).encode("utf-8")
+
 
-je_df = pd.DataFrame(je_rows)
+je_df, je_csv = build_je(views["ap_hi"], views["tax_hi"], views["lease_hi"])
 
 # ---------- Display ----------
 if je_df.empty:
@@ -381,7 +564,7 @@ else:
     # ---------- Export ----------
     st.download_button(
         label="Download Suggested JE CSV",
-        data=je_df.to_csv(index=False).encode("utf-8"),
+        data=je_csv,
         file_name="Suggested_Journal_Entries_FY2025.csv",
         mime="text/csv"
     )
@@ -1,6 +1,15 @@
 # scoring_rules.py
 
 import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional — the NumPy path below is used without it
+    njit = None
+
+# Below this many rows the JIT compile costs more than the fused kernel saves
+NUMBA_MIN_ROWS = 100_000
 
 # -------------------------
 # Generic risk band mapper
@@ -16,6 +25,90 @@ def classify_risk(score: float) -> str:
         return "Critical (85–99%)"
 
 
+# Upper (inclusive) edge of each band, in the same order as classify_risk
+_BINS = np.array([20, 40, 70, 100])
+_LABELS = np.array(["Low (5–15%)", "Medium (20–40%)", "High (50–80%)", "Critical (85–99%)"], dtype=object)
+
+
+def risk_band_codes(scores: np.ndarray) -> np.ndarray:
+    """Band index (0–3) for each score via a sorted-bin lookup."""
+    return np.searchsorted(_BINS, scores, side="left").clip(0, len(_BINS) - 1)
+
+
+def classify_risk_categorical(scores: np.ndarray) -> pd.Categorical:
+    """Vectorized classify_risk as a Categorical — int8 codes plus the four band labels."""
+    return pd.Categorical.from_codes(risk_band_codes(scores).astype(np.int8), categories=_LABELS)
+
+
+def _flag(df: pd.DataFrame, col: str) -> np.ndarray:
+    """Boolean flag column as 0/1 ints, False when the column is absent.
+
+    int16 rather than int8 so the weighted sums below can't wrap past 127.
+    """
+    if col not in df:
+        return np.zeros(len(df), dtype=np.int16)
+    return np.asarray(df[col], dtype=bool).astype(np.int16)
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _score_kernel(flags, weights, counted, pairs, anchors, min_flags, floor, out):
+        # One branchless pass per row across the flag columns: base + weights, pair
+        # bumps, "anchor + any other flag" bumps, then the multi-flag floor and cap.
+        for i in prange(out.shape[0]):
+            s = 5
+            n = 0
+            for j in range(len(flags)):
+                f = flags[j][i]
+                s += weights[j] * f
+                n += counted[j] * f
+            for p in range(pairs.shape[0]):
+                s += pairs[p, 2] * (flags[pairs[p, 0]][i] & flags[pairs[p, 1]][i])
+            for a in range(anchors.shape[0]):
+                s += anchors[a, 1] * (flags[anchors[a, 0]][i] & (n > 1))
+            if n >= min_flags:
+                s = max(s, floor)
+            out[i] = min(s, 100)
+
+
+def _score(flags: dict[str, np.ndarray], weights: dict[str, int], floor: int,
+           pairs=(), anchors=(), uncounted=(), min_flags: int = 3) -> np.ndarray:
+    """Score every row from one model's rule table.
+
+    weights maps flag name -> points; pairs are (flag_a, flag_b, bump) combos;
+    anchors are (flag, bump), applied when that flag is set together with any
+    other counted flag; rows with min_flags+ counted flags are lifted to floor.
+    Large frames use the numba kernel, everything else the NumPy expression —
+    both read the same table, so they can't drift apart.
+    """
+    names = list(weights)
+    cols = [flags[name] for name in names]
+    counted = [name not in uncounted for name in names]
+
+    if njit is not None and len(cols[0]) >= NUMBA_MIN_ROWS:
+        out = np.empty(len(cols[0]), dtype=np.int16)
+        _score_kernel(
+            tuple(cols),
+            np.asarray([weights[name] for name in names], dtype=np.int64),
+            np.asarray(counted, dtype=np.int64),
+            np.asarray([(names.index(a), names.index(b), bump) for a, b, bump in pairs], dtype=np.int64).reshape(-1, 3),
+            np.asarray([(names.index(a), bump) for a, bump in anchors], dtype=np.int64).reshape(-1, 2),
+            min_flags,
+            floor,
+            out,
+        )
+        return out.astype(np.int8)
+
+    s = 5 + sum(weights[name] * flags[name] for name in names)
+    n = sum(col for col, is_counted in zip(cols, counted) if is_counted)
+    for a, b, bump in pairs:
+        s += bump * (flags[a] & flags[b])
+    for a, bump in anchors:
+        s += bump * (flags[a] & (n > 1))
+    s = np.where(n >= min_flags, np.maximum(s, floor), s)
+    return np.minimum(s, 100).astype(np.int8)
+
+
 # ============================================================
 # MODEL A – AP ↔ GL discrepancy risk (per INVOICE)
 # ============================================================
@@ -64,6 +157,26 @@ def score_ap_row(row) -> tuple[float, str]:
     return score, classify_risk(score)
 
 
+# missing_in_GL + any other flag → +20; 3 or more flags → 90+
+AP_RULES = {
+    "weights": {
+        "late_posting": 10,
+        "amount_mismatch": 30,
+        "unusual_GL_account": 25,
+        "duplicate_invoice_number": 40,
+        "missing_in_GL": 60,
+    },
+    "anchors": [("missing_in_GL", 20)],
+    "floor": 90,
+}
+
+
+def score_ap_frame(df: pd.DataFrame) -> tuple[np.ndarray, pd.Categorical]:
+    """Vectorized score_ap_row over a whole frame."""
+    s = _score({c: _flag(df, c) for c in AP_RULES["weights"]}, **AP_RULES)
+    return s, classify_risk_categorical(s)
+
+
 # ============================================================
 # MODEL B – Bank ↔ AP/Cash discrepancy risk (per PAYMENT)
 # ============================================================
@@ -115,6 +228,26 @@ def score_bank_row(row) -> tuple[float, str]:
     return score, classify_risk(score)
 
 
+BANK_RULES = {
+    "weights": {
+        "unusual_vendor_payment": 10,
+        "amount_mismatch": 25,
+        "invoice_marked_paid_but_no_bank_txn": 40,
+        "no_matching_invoice": 50,
+        "duplicate_payment": 60,
+    },
+    "pairs": [("duplicate_payment", "amount_mismatch", 15)],
+    "anchors": [("no_matching_invoice", 20)],
+    "floor": 90,
+}
+
+
+def score_bank_frame(df: pd.DataFrame) -> tuple[np.ndarray, pd.Categorical]:
+    """Vectorized score_bank_row over a whole frame."""
+    s = _score({c: _flag(df, c) for c in BANK_RULES["weights"]}, **BANK_RULES)
+    return s, classify_risk_categorical(s)
+
+
 # ============================================================
 # MODEL C – Sales & Use Tax discrepancy risk (per INVOICE)
 # ============================================================
@@ -182,6 +315,38 @@ def score_tax_row(row) -> tuple[float, str]:
     return score, classify_risk(score)
 
 
+# large_tax_diff (per-invoice diff > $5) adds points but isn't counted toward the 3-flag floor
+TAX_RULES = {
+    "weights": {
+        "jurisdiction_missing": 15,
+        "rate_mismatch": 30,
+        "tax_missing": 40,
+        "tax_on_nontaxable_item": 35,
+        "gl_tax_diff_flag": 25,
+        "large_tax_diff": 10,
+    },
+    "pairs": [
+        ("tax_missing", "rate_mismatch", 65),
+        ("tax_missing", "gl_tax_diff_flag", 70),
+        ("tax_on_nontaxable_item", "rate_mismatch", 60),
+    ],
+    "uncounted": ["large_tax_diff"],
+    "floor": 85,
+}
+
+
+def score_tax_frame(df: pd.DataFrame) -> tuple[np.ndarray, pd.Categorical]:
+    """Vectorized score_tax_row over a whole frame."""
+    flags = {c: _flag(df, c) for c in TAX_RULES["weights"] if c != "large_tax_diff"}
+    if "tax_diff_abs" in df:
+        flags["large_tax_diff"] = (np.asarray(df["tax_diff_abs"], dtype=float) > 5).astype(np.int16)
+    else:
+        flags["large_tax_diff"] = np.zeros(len(df), dtype=np.int16)
+
+    s = _score(flags, **TAX_RULES)
+    return s, classify_risk_categorical(s)
+
+
 # ============================================================
 # MODEL D – Lease (ASC 842) discrepancy risk (per LEASE LINE)
 # ============================================================
@@ -244,3 +409,26 @@ def score_lease_row(row) -> tuple[float, str]:
 
     score = min(score, 100)
     return score, classify_risk(score)
+
+
+LEASE_RULES = {
+    "weights": {
+        "schedule_to_GL_liability_diff_flag": 20,
+        "schedule_to_GL_ROU_diff_flag": 20,
+        "missing_periods": 40,
+        "incorrect_opening_entry": 50,
+        "classification_flag": 45,
+        "ip_sum_mismatch": 50,
+    },
+    "pairs": [
+        ("schedule_to_GL_liability_diff_flag", "missing_periods", 30),
+        ("schedule_to_GL_ROU_diff_flag", "incorrect_opening_entry", 35),
+    ],
+    "floor": 90,
+}
+
+
+def score_lease_frame(df: pd.DataFrame) -> tuple[np.ndarray, pd.Categorical]:
+    """Vectorized score_lease_row over a whole frame."""
+    s = _score({c: _flag(df, c) for c in LEASE_RULES["weights"]}, **LEASE_RULES)
+    return s, classify_risk_categorical(s)
@@ -1,11 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
-from google.cloud import bigquery
+from google.cloud import bigquery, bigquery_storage
 from scoring_rules import (
-    score_ap_row,
-    score_bank_row,
-    score_tax_row,
-    score_lease_row,
+    score_ap_frame,
+    score_bank_frame,
+    score_tax_frame,
+    score_lease_frame,
 )
 
 # --------------------------------------------------
@@ -23,42 +25,76 @@ TAX_RATE_TABLE = "tax_rate_reference"
 
 BQ_LOCATION = "us-east1"
 
+# Low-cardinality text columns stored as categoricals in the Parquet outputs
+CATEGORY_COLUMNS = ["Vendor", "State", "GL_Account", "mode_gl", "risk_level"]
+
 client = bigquery.Client(
     project=PROJECT_ID,
     location=BQ_LOCATION
 )
 
+# Storage Read API client — streams results as Arrow instead of paging via tabledata.list
+bqstorage_client = bigquery_storage.BigQueryReadClient()
+
 # --------------------------------------------------
 # HELPERS
 # --------------------------------------------------
-def load_table(table_name: str) -> pd.DataFrame:
+def load_table(table_name: str, columns: list[str] | None = None) -> pd.DataFrame:
+    select = ", ".join(f"`{c}`" for c in columns) if columns else "*"
     query = f"""
-        SELECT *
+        SELECT {select}
         FROM `{PROJECT_ID}.{DATASET}.{table_name}`
     """
-    return client.query(query).to_dataframe()
+    return client.query(query).to_dataframe(
+        bqstorage_client=bqstorage_client,
+        create_bqstorage_client=False,
+    )
+
+
+# GL balances with account-type masks, fetched once per run and shared by tax and leases
+def load_gl() -> pd.DataFrame:
+    gl = load_table(GL_TABLE, columns=["Account", "Ending_Balance"])
+
+    # Lowercase once, then plain substring checks instead of case-insensitive regex
+    account = gl["Account"].astype("string").str.lower().fillna("")
+    gl["is_tax"] = account.str.contains("tax", regex=False).to_numpy(dtype=bool)
+    gl["is_lease"] = account.str.contains("lease", regex=False).to_numpy(dtype=bool)
+    gl["is_rou"] = account.str.contains("rou", regex=False).to_numpy(dtype=bool)
+    return gl
 
 
 def write_output(df: pd.DataFrame, filename: str):
     df.to_csv(f"output/{filename}", index=False)
     print(f"✅ Wrote output/{filename}")
 
+    # Columnar copy for the dashboard — typed and much faster to load than CSV.
+    # Written with the compact dtypes the dashboard uses so reloads need no conversion.
+    compact = {c: "category" for c in CATEGORY_COLUMNS if c in df}
+    compact["risk_score"] = "int8"
+    parquet_name = filename.rsplit(".", 1)[0] + ".parquet"
+    df.astype(compact).to_parquet(f"output/{parquet_name}", engine="pyarrow", compression="zstd", index=False)
+    print(f"✅ Wrote output/{parquet_name}")
+
 
 # --------------------------------------------------
 # MODEL A — AP ↔ GL VALIDATION
 # --------------------------------------------------
-def validate_ap():
+def validate_ap(ap):
     print(" Validating AP_Subledger …")
 
-    ap = load_table(AP_TABLE)
-
-    # Type safety
-    ap["Total_Invoice_Amount"] = pd.to_numeric(ap["Total_Invoice_Amount"], errors="coerce").fillna(0)
-    ap["Expected_Total"] = pd.to_numeric(ap["Expected_Total"], errors="coerce").fillna(0)
+    # Type safety — convert both amount columns in one block
+    amount_cols = ["Total_Invoice_Amount", "Expected_Total"]
+    ap[amount_cols] = ap[amount_cols].apply(pd.to_numeric, errors="coerce").fillna(0).astype("float64")
 
     # Flags
-    ap["amount_mismatch"] = (ap["Total_Invoice_Amount"] - ap["Expected_Total"]).abs() > 25
-    ap["missing_in_GL"] = ap["AP_Match_Key"].isna() | (ap["AP_Match_Key"].astype(str).str.strip() == "") | (ap["AP_Match_Key"] == "Missing")
+    total = ap["Total_Invoice_Amount"].to_numpy()
+    expected = ap["Expected_Total"].to_numpy()
+    ap["amount_mismatch"] = np.abs(total - expected) > 25
+
+    # Blank-after-strip is empty or all-whitespace — checked without building stripped copies
+    match_key = ap["AP_Match_Key"].astype("string")
+    blank = (match_key.str.len() == 0) | match_key.str.isspace()
+    ap["missing_in_GL"] = (match_key.isna() | blank.fillna(False) | (match_key == "Missing").fillna(False)).to_numpy(dtype=bool)
 
     ap["Invoice_Date"] = pd.to_datetime(ap["Invoice_Date"], errors="coerce")
     year_end = pd.Timestamp("2025-12-31")
@@ -66,19 +102,15 @@ def validate_ap():
 
     ap["duplicate_invoice_number"] = ap.duplicated(subset=["Vendor", "Invoice_ID"], keep=False)
 
-    vendor_gl_mode = (
-        ap.groupby(["Vendor", "GL_Account"])
-          .size()
-          .reset_index(name="cnt")
-          .sort_values("cnt", ascending=False)
-          .drop_duplicates("Vendor")
-    )
-    vendor_gl_mode = vendor_gl_mode.rename(columns={"GL_Account": "mode_gl"})
-    ap = ap.merge(vendor_gl_mode[["Vendor", "mode_gl"]], on="Vendor", how="left")
-    ap["unusual_GL_account"] = ap["GL_Account"] != ap["mode_gl"]
+    # Most common GL account per vendor (ties go to the lowest account)
+    mode_map = pd.crosstab(ap["Vendor"], ap["GL_Account"]).idxmax(axis=1)
+    ap["mode_gl"] = ap["Vendor"].map(mode_map)
+    ap["unusual_GL_account"] = ap["GL_Account"].to_numpy() != ap["mode_gl"].to_numpy()
 
     # Risk scoring
-    ap["risk_score"], ap["risk_level"] = zip(*ap.apply(score_ap_row, axis=1))
+    scores, levels = score_ap_frame(ap)
+    ap["risk_score"] = scores
+    ap["risk_level"] = levels
 
     write_output(ap, "AP_with_risk.csv")
     return ap
@@ -87,10 +119,9 @@ def validate_ap():
 # --------------------------------------------------
 # MODEL B — BANK ↔ AP VALIDATION
 # --------------------------------------------------
-def validate_bank(ap):
+def validate_bank(bank, ap):
     print(" Validating Bank_Transactions …")
 
-    bank = load_table(BANK_TABLE)
     bank["Amount"] = pd.to_numeric(bank["Amount"], errors="coerce").fillna(0)
 
     ap_join = ap[["AP_Match_Key", "Total_Invoice_Amount"]].rename(
@@ -102,13 +133,14 @@ def validate_bank(ap):
     bank["duplicate_payment"] = bank["Duplicate_Payment_Flag"] == True
     bank["amount_mismatch"] = (bank["Amount"] - bank["Invoice_Amount"].fillna(0)).abs() > 1
 
-    q90 = bank.groupby("Vendor")["Amount"].quantile(0.90).reset_index(name="q90")
-    bank = bank.merge(q90, on="Vendor", how="left")
+    bank["q90"] = bank.groupby("Vendor")["Amount"].transform("quantile", q=0.90)
     bank["unusual_vendor_payment"] = bank["Amount"] > bank["q90"]
 
     bank["invoice_marked_paid_but_no_bank_txn"] = False
 
-    bank["risk_score"], bank["risk_level"] = zip(*bank.apply(score_bank_row, axis=1))
+    scores, levels = score_bank_frame(bank)
+    bank["risk_score"] = scores
+    bank["risk_level"] = levels
 
     write_output(bank, "Bank_with_risk.csv")
     return bank
@@ -117,13 +149,9 @@ def validate_bank(ap):
 # --------------------------------------------------
 # MODEL C — SALES & USE TAX VALIDATION
 # --------------------------------------------------
-def validate_tax():
+def validate_tax(tax, gl, rates):
     print(" Validating Sales & Use Tax …")
 
-    tax = load_table(TAX_TABLE)
-    gl = load_table(GL_TABLE)
-    rates = load_table(TAX_RATE_TABLE)
-
     tax["Taxable_Amount"] = pd.to_numeric(tax["Taxable_Amount"], errors="coerce").fillna(0)
     tax["Calculated_Tax"] = pd.to_numeric(tax["Calculated_Tax"], errors="coerce").fillna(0)
     tax["Recalc_Tax"] = pd.to_numeric(tax["Recalc_Tax"], errors="coerce").fillna(0)
@@ -141,13 +169,15 @@ def validate_tax():
     tax["tax_on_nontaxable_item"] = (tax["Taxable_Amount"] == 0) & (tax["Calculated_Tax"] > 0)
     tax["tax_diff_abs"] = (tax["Calculated_Tax"] - tax["Recalc_Tax"]).abs()
 
-    gl_tax = gl[gl["Account"].str.contains("Tax", case=False, na=False)]
+    gl_tax = gl[gl["is_tax"]]
     gl_tax_balance = gl_tax["Ending_Balance"].sum()
     invoice_tax_total = tax["Calculated_Tax"].sum()
 
     tax["gl_tax_diff_flag"] = abs(gl_tax_balance - invoice_tax_total) > 100
 
-    tax["risk_score"], tax["risk_level"] = zip(*tax.apply(score_tax_row, axis=1))
+    scores, levels = score_tax_frame(tax)
+    tax["risk_score"] = scores
+    tax["risk_level"] = levels
 
     write_output(tax, "Tax_with_risk.csv")
     return tax
@@ -156,12 +186,9 @@ def validate_tax():
 # --------------------------------------------------
 # MODEL D — ASC 842 LEASE VALIDATION
 # --------------------------------------------------
-def validate_leases():
+def validate_leases(leases, gl):
     print("🔍 Validating ASC 842 Leases …")
 
-    leases = load_table(LEASE_TABLE)
-    gl = load_table(GL_TABLE)
-
     leases["ip_sum_mismatch"] = leases["IP_Sum_Mismatch_Flag"] == True
     leases["missing_periods"] = leases["Sequence_Check"] == "Sequence Error"
 
@@ -170,8 +197,8 @@ def validate_leases():
         sched_rou=("ROU_Asset_Balance", "max")
     ).reset_index()
 
-    gl_liab = gl[gl["Account"].str.contains("Lease", case=False, na=False)]
-    gl_rou = gl[gl["Account"].str.contains("ROU", case=False, na=False)]
+    gl_liab = gl[gl["is_lease"]]
+    gl_rou = gl[gl["is_rou"]]
 
     leases["schedule_to_GL_liability_diff_flag"] = abs(gl_liab["Ending_Balance"].sum() - lease_totals["sched_liability"].sum()) > 0
     leases["schedule_to_GL_ROU_diff_flag"] = abs(gl_rou["Ending_Balance"].sum() - lease_totals["sched_rou"].sum()) > 0
@@ -179,7 +206,9 @@ def validate_leases():
     leases["incorrect_opening_entry"] = False
     leases["classification_flag"] = False
 
-    leases["risk_score"], leases["risk_level"] = zip(*leases.apply(score_lease_row, axis=1))
+    scores, levels = score_lease_frame(leases)
+    leases["risk_score"] = scores
+    leases["risk_level"] = levels
 
     write_output(leases, "Lease_with_risk.csv")
     return leases
@@ -191,10 +220,22 @@ def validate_leases():
 def run_pipeline():
     print("\n Starting Peak Power Services Year-End Validator\n")
 
-    ap = validate_ap()
-    validate_bank(ap)
-    validate_tax()
-    validate_leases()
+    # All source reads are independent and network-bound, so issue them concurrently
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        futures = {
+            "ap": pool.submit(load_table, AP_TABLE),
+            "bank": pool.submit(load_table, BANK_TABLE),
+            "tax": pool.submit(load_table, TAX_TABLE),
+            "leases": pool.submit(load_table, LEASE_TABLE),
+            "gl": pool.submit(load_gl),
+            "rates": pool.submit(load_table, TAX_RATE_TABLE, ["Tax_Jurisdiction", "Total_Tax_Rate_2025"]),
+        }
+        tables = {name: future.result() for name, future in futures.items()}
+
+    ap = validate_ap(tables["ap"])
+    validate_bank(tables["bank"], ap)
+    validate_tax(tables["tax"], tables["gl"], tables["rates"])
+    validate_leases(tables["leases"], tables["gl"])
 
     print("\n Year-end validation pipeline completed successfully.")
 